@@ -1,6 +1,18 @@
+import atexit
+
 from django.apps import AppConfig
 
 
 class ImageserviceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.imageService'
+
+    def ready(self):
+        from .services.geoserver_service import close_session
+        from .services.utils import configure_gdal
+
+        configure_gdal()
+
+        # Django has no shutdown signal; release pooled connections at process exit.
+        # KafkaService registers its own close hook once its producer exists
+        atexit.register(close_session)
@@ -1,6 +1,22 @@
-from .geoserver_service import GeoServerService
-from .ndvi_processor import NDVIProcessor
-from .ndwi_processor import NDWIProcessor
-from .kafka_service import KafkaService
+import importlib
 
-__all__ = ['GeoServerService', 'NDVIProcessor', 'NDWIProcessor', 'KafkaService']
+# Services are imported on first access so that importing one of them does
+# not pull in GDAL, numpy and kafka-python for all of the others
+_SERVICE_MODULES = {
+    'GeoServerService': '.geoserver_service',
+    'NDVIProcessor': '.ndvi_processor',
+    'NDWIProcessor': '.ndwi_processor',
+    'IndicesProcessor': '.indices_processor',
+    'KafkaService': '.kafka_service',
+}
+
+__all__ = ['GeoServerService', 'NDVIProcessor', 'NDWIProcessor', 'IndicesProcessor', 'KafkaService']
+
+
+def __getattr__(name):
+    if name in _SERVICE_MODULES:
+        module = importlib.import_module(_SERVICE_MODULES[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
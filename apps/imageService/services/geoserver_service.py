@@ -1,41 +1,117 @@
 import requests
+import functools
 import json
 import logging
-from urllib.parse import urlparse
+import orjson
+import os
+import stat
+import threading
+from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from django.conf import settings
-from urllib.parse import urlparse, unquote
-from urllib.request import url2pathname
+from django.core.cache import caches
+from urllib.parse import urlparse
 
 logger = logging.getLogger(__name__)
 
+# Recently confirmed files; only positive results are cached so new files show up at once
+_existing_files = TTLCache(maxsize=1024, ttl=60)
+_existing_files_lock = threading.Lock()
+
+# Returned by _create_coverage_store when GeoServer reports the store already exists
+STORE_EXISTS = object()
+
+# Stops GeoServer from logging a stack trace for lookups of missing resources
+QUIET_NOT_FOUND = {'quietOnNotFound': 'true'}
+
+# Upper bound on how much of an error response body is decoded for logging
+ERROR_BODY_LIMIT = 2048
+
+_session = None
+_session_lock = threading.Lock()
+
+_instance = None
+_instance_lock = threading.Lock()
+
+
+def get_session():
+    """Return the process-wide HTTP session used for GeoServer REST calls"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            session.auth = (
+                getattr(settings, 'GEOSERVER_USERNAME', 'admin'),
+                getattr(settings, 'GEOSERVER_PASSWORD', 'geoserver')
+            )
+            session.headers.update({'Content-Type': 'application/json'})
+            
+            # Only idempotent lookups are retried; a retried POST could create a store twice
+            retry = Retry(
+                total=3,
+                connect=3,
+                read=2,
+                status=3,
+                backoff_factor=0.25,
+                status_forcelist=(502, 503, 504),
+                allowed_methods=frozenset(['GET', 'HEAD'])
+            )
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=retry)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+
+def close_session():
+    """Close the shared GeoServer HTTP session"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
 class GeoServerService:
     
+    @classmethod
+    def get_instance(cls):
+        """Return the process-wide GeoServerService, creating it on first use"""
+        global _instance
+        with _instance_lock:
+            if _instance is None:
+                _instance = cls()
+            return _instance
+    
     def __init__(self):
         self.base_url = getattr(settings, 'GEOSERVER_BASE_URL', 'http://localhost:8080/geoserver')
         self.rest_url = f"{self.base_url}/rest"
-        self.username = getattr(settings, 'GEOSERVER_USERNAME', 'admin')
-        self.password = getattr(settings, 'GEOSERVER_PASSWORD', 'geoserver')
-        self.auth = (self.username, self.password)
+        self.workspaces_url = f"{self.rest_url}/workspaces"
+        self.http = get_session()
+        self.path_cache = caches['geoserver']
     
     def get_layer_file_path(self, workspace, layer_name):
         """
         Extract file path from GeoServer coverage store metadata
         Returns file path or None if layer not found
         """
+        cache_key = self._layer_path_cache_key(workspace, layer_name)
+        cached_path = self.path_cache.get(cache_key)
+        if cached_path and self._validate_file_exists(cached_path):
+            return cached_path
+        
         try:
-            coverage_store_url = (
-                f"{self.rest_url}/workspaces/{workspace}/"
-                f"coveragestores/{layer_name}.json"
-            )
+            coverage_store_url = f"{self._cs_url(workspace, layer_name)}.json"
             
-            response = requests.get(coverage_store_url, auth=self.auth, timeout=30)
+            response = self.http.get(coverage_store_url, params=QUIET_NOT_FOUND, timeout=30)
             
             if response.status_code == 404:
                 logger.warning(f"Coverage store {workspace}:{layer_name} not found")
                 return None
             
             response.raise_for_status()
-            data = response.json()
+            data = orjson.loads(response.content)
             
             file_url = data['coverageStore']['url']
             file_path = self._extract_file_path(file_url)
@@ -44,6 +120,7 @@ class GeoServerService:
                 logger.error(f"File not found at path: {file_path}")
                 return None
             
+            self.path_cache.set(cache_key, file_path)
             return file_path
             
         except requests.RequestException as e:
@@ -58,8 +135,8 @@ class GeoServerService:
         Check if NDVI layer already exists to prevent overwrite
         """
         try:
-            layer_url = f"{self.rest_url}/workspaces/{workspace}/layers/{layer_name}.json"
-            response = requests.get(layer_url, auth=self.auth, timeout=30)
+            layer_url = f"{self._ws_url(workspace)}/layers/{layer_name}.json"
+            response = self.http.head(layer_url, params=QUIET_NOT_FOUND, timeout=30)
             return response.status_code == 200
         except requests.RequestException:
             return False
@@ -67,40 +144,95 @@ class GeoServerService:
     def publish_ndvi_layer(self, workspace, layer_name, file_path):
         """Publish processed NDVI layer to GeoServer (no styling needed)"""
         try:
-            if self.check_layer_exists(workspace, layer_name):
-                logger.error(f"Layer {workspace}:{layer_name} already exists")
-                return False
-            
             coverage_store_created = self._create_coverage_store(
                 workspace, layer_name, file_path
             )
             
+            if coverage_store_created is STORE_EXISTS:
+                logger.error(f"Layer {workspace}:{layer_name} already exists")
+                return False
+            
             if not coverage_store_created:
                 return False
             
             coverage_created = self._create_coverage(workspace, layer_name)
+            if coverage_created:
+                self.invalidate(workspace, layer_name)
             return coverage_created
             
         except Exception as e:
             logger.error(f"Failed to publish NDVI layer: {str(e)}")
             return False
     
-    def _extract_file_path(self, file_url):
+    def invalidate(self, workspace, layer_name):
+        """Drop the cached file path of a layer, e.g. after it was overwritten"""
+        self.path_cache.delete(self._layer_path_cache_key(workspace, layer_name))
+    
+    def publish_many(self, items, max_workers=4):
+        """
+        Publish several layers concurrently
+        items is an iterable of (workspace, layer_name, file_path) tuples,
+        returns a list of (workspace:layer_name, success, error) tuples in the same order
+        
+        max_workers bounds the number of publishes in flight, GeoServer
+        degrades quickly under many parallel catalog writes
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(lambda item: self._publish_one(*item), items))
+    
+    def _publish_one(self, workspace, layer_name, file_path):
+        """Publish a single layer for publish_many without raising"""
+        key = f"{workspace}:{layer_name}"
+        try:
+            if self.publish_ndvi_layer(workspace, layer_name, file_path):
+                return key, True, None
+            return key, False, f"Failed to publish layer {key}"
+        except Exception as e:
+            return key, False, str(e)
+    
+    def _ws_url(self, workspace):
+        """REST URL of a workspace"""
+        return f"{self.workspaces_url}/{workspace}"
+    
+    def _cs_url(self, workspace, store_name):
+        """REST URL of a coverage store"""
+        return f"{self.workspaces_url}/{workspace}/coveragestores/{store_name}"
+    
+    def _layer_path_cache_key(self, workspace, layer_name):
+        """Cache key for a resolved layer file path"""
+        return f"{workspace}:{layer_name}"
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def _extract_file_path(file_url):
         """Extract local file path from file:// URL"""
         parsed_url = urlparse(file_url)
         return parsed_url.path
     
-        
     def _validate_file_exists(self, file_path):
         """Validate that the file exists on local filesystem"""
-        import os
-        return os.path.exists(file_path) and os.path.isfile(file_path)
+        with _existing_files_lock:
+            if file_path in _existing_files:
+                return True
+        
+        try:
+            exists = stat.S_ISREG(os.stat(file_path).st_mode)
+        except OSError:
+            return False
+        
+        if exists:
+            with _existing_files_lock:
+                _existing_files[file_path] = True
+        return exists
     
 
     def _create_coverage_store(self, workspace, store_name, file_path):
-        """Create GeoServer coverage store for NDVI layer"""
+        """
+        Create GeoServer coverage store for NDVI layer
+        Returns True on success, STORE_EXISTS if the store is already there, False otherwise
+        """
         try:
-            url = f"{self.rest_url}/workspaces/{workspace}/coveragestores"
+            url = f"{self._ws_url(workspace)}/coveragestores"
             
             payload = {
                 "coverageStore": {
@@ -117,23 +249,24 @@ class GeoServerService:
             logger.info(f"Creating coverage store: {store_name} in workspace: {workspace}")
             logger.info(f"File path: {file_path}")
             
-            response = requests.post(
-                url, 
-                json=payload,
-                headers={'Content-Type': 'application/json'},
-                auth=self.auth,
-                timeout=60
-            )
+            response = self.http.post(url, json=payload, timeout=60)
             
-            if response.status_code != 201:
-                logger.error(f"Coverage store creation failed:")
-                logger.error(f"Status: {response.status_code}")
-                logger.error(f"Response: {response.text}")
-                logger.error(f"URL: {url}")
-                return False
+            if response.status_code == 201:
+                logger.info(f"Coverage store {store_name} created successfully")
+                return True
             
-            logger.info(f"Coverage store {store_name} created successfully")
-            return True
+            body = response.content[:ERROR_BODY_LIMIT].decode('utf-8', 'replace')
+            
+            if response.status_code == 409 or (
+                response.status_code == 500 and 'already exists' in body
+            ):
+                return STORE_EXISTS
+            
+            logger.error(f"Coverage store creation failed:")
+            logger.error(f"Status: {response.status_code}")
+            logger.error(f"Response: {body}")
+            logger.error(f"URL: {url}")
+            return False
             
         except Exception as e:
             logger.error(f"Coverage store creation error: {str(e)}")
@@ -142,8 +275,7 @@ class GeoServerService:
     def _create_coverage(self, workspace, layer_name):
         """Create GeoServer coverage (layer) from coverage store"""
         try:
-            url = (f"{self.rest_url}/workspaces/{workspace}/"
-                   f"coveragestores/{layer_name}/coverages")
+            url = f"{self._cs_url(workspace, layer_name)}/coverages"
             
             payload = {
                 "coverage": {
@@ -153,13 +285,7 @@ class GeoServerService:
                 }
             }
             
-            response = requests.post(
-                url,
-                json=payload,
-                headers={'Content-Type': 'application/json'},
-                auth=self.auth,
-                timeout=60
-            )
+            response = self.http.post(url, json=payload, timeout=60)
             
             response.raise_for_status()
             return True
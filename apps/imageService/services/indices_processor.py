@@ -0,0 +1,83 @@
+import os
+from osgeo import gdal
+import logging
+from .ndvi_processor import NDVI_LUT
+from .ndwi_processor import NDWI_LUT
+from .utils import (
+    open_input_file, generate_output_path, cleanup_file, calculate_indices, apply_color_lut
+)
+
+logger = logging.getLogger(__name__)
+
+class IndicesProcessor:
+    """Compute several spectral indices from one pass over the input bands"""
+
+    def __init__(self):
+        gdal.UseExceptions()
+        self.green_band = 3
+        self.red_band = 4
+        self.nir_band = 8
+
+        # Each index is (a - b) / (a + b) over a pair of bands, styled through its LUT
+        self.indices = {
+            'NDVI': (self.nir_band, self.red_band, NDVI_LUT),
+            'NDWI': (self.green_band, self.nir_band, NDWI_LUT),
+        }
+
+    def process_indices(self, input_file_path, workspace, layer_name, indices):
+        """
+        Process Sentinel-2 image to calculate the requested indices (NDVI, NDWI) and apply styling
+        Returns a dict of index -> styled output path, or None if processing fails
+        """
+        input_ds = None
+        # Every file this run may write, removed again if it fails
+        output_paths = []
+
+        try:
+            input_ds = open_input_file(input_file_path)
+            if input_ds is None:
+                return None
+
+            index_paths = {
+                index: generate_output_path(input_file_path, layer_name, f"_{index}")
+                for index in indices
+            }
+            styled_paths = {
+                index: generate_output_path(input_file_path, layer_name, f"_{index}_styled")
+                for index in indices
+            }
+
+            for styled_path in styled_paths.values():
+                if os.path.exists(styled_path):
+                    logger.error(f"Styled file already exists: {styled_path}")
+                    return None
+
+            output_paths = [*index_paths.values(), *styled_paths.values()]
+
+            targets = [
+                (index_paths[index], *self.indices[index][:2]) for index in indices
+            ]
+            if not calculate_indices(input_ds, targets):
+                self._cleanup_files(output_paths)
+                return None
+
+            for index in indices:
+                apply_color_lut(index_paths[index], styled_paths[index], self.indices[index][2])
+
+            self._cleanup_files(index_paths.values())
+
+            logger.info(f"Index processing completed: {styled_paths}")
+            return styled_paths
+
+        except Exception as e:
+            logger.error(f"Index processing failed: {str(e)}")
+            self._cleanup_files(output_paths)
+            return None
+
+        finally:
+            input_ds = None
+
+    def _cleanup_files(self, file_paths):
+        """Remove files if they exist"""
+        for file_path in file_paths:
+            cleanup_file(file_path)
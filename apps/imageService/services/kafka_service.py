@@ -1,32 +1,109 @@
-import json
+import atexit
 import logging
-from datetime import datetime
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+import orjson
 from kafka import KafkaProducer
 from kafka.errors import KafkaError
 from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+# Messages waiting for the background sender; publishing fails fast once full
+SEND_QUEUE_SIZE = 10000
+
+# Seconds between attempts to create the producer after it failed to initialize
+PRODUCER_RETRY_INTERVAL = 30
+
+# Tells the sender thread to stop
+_STOP = object()
+
+_instance = None
+_instance_lock = threading.Lock()
+
 class KafkaService:
     
+    @classmethod
+    def get_instance(cls):
+        """
+        Return the process-wide KafkaService, creating it on first use
+        
+        If the producer could not be created (e.g. the broker was down when the
+        worker started) it is retried, at most once every PRODUCER_RETRY_INTERVAL seconds
+        """
+        global _instance
+        with _instance_lock:
+            if _instance is None:
+                _instance = cls()
+            elif _instance.producer is None:
+                _instance._retry_producer()
+            return _instance
+    
+    @classmethod
+    def close_instance(cls):
+        """Close the process-wide KafkaService if it was created"""
+        global _instance
+        with _instance_lock:
+            if _instance is not None:
+                _instance.close()
+                _instance = None
+    
     def __init__(self):
         self.bootstrap_servers = getattr(settings, 'KAFKA_BOOTSTRAP_SERVERS', '10.208.26.232:9092')
         self.topic = getattr(settings, 'KAFKA_TOPIC', 'image-processing-status')
         self.producer = None
+        self._queue = queue.Queue(maxsize=SEND_QUEUE_SIZE)
+        self._sender = None
+        self._last_attempt = None
+        self._closed = False
+        # Serialises queueing with close() so no message lands behind the stop marker
+        self._lock = threading.Lock()
+        self._initialize_producer()
+        self._start_sender()
+    
+    def _start_sender(self):
+        """Start the background sender thread once a producer is available"""
+        if self.producer and self._sender is None:
+            self._sender = threading.Thread(
+                target=self._send_queued_messages, args=(self.producer,),
+                name='kafka-sender', daemon=True
+            )
+            self._sender.start()
+    
+    def _retry_producer(self):
+        """Try again to create the producer, unless closed or the last attempt was too recent"""
+        if self._closed or time.monotonic() - self._last_attempt < PRODUCER_RETRY_INTERVAL:
+            return
+        
         self._initialize_producer()
+        self._start_sender()
     
     def _initialize_producer(self):
         """Initialize Kafka producer with error handling"""
+        self._last_attempt = time.monotonic()
         try:
             self.producer = KafkaProducer(
                 bootstrap_servers=self.bootstrap_servers,
-                value_serializer=lambda v: json.dumps(v).encode('utf-8'),
-                key_serializer=lambda k: k.encode('utf-8') if k else None,
+                value_serializer=orjson.dumps,
                 retries=3,
                 request_timeout_ms=30000,
+                linger_ms=20,
+                batch_size=64 * 1024,
+                compression_type='lz4',
+                acks=1,
                 api_version=(0, 10, 1)
             )
             logger.info(f"Kafka producer initialized for {self.bootstrap_servers}")
+            
+            # KafkaProducer registers an atexit handler that closes it without waiting.
+            # atexit runs handlers last-registered-first, so registering close() after it
+            # lets queued and lingering messages go out before the producer is shut
+            atexit.unregister(self.close)
+            atexit.register(self.close)
         except Exception as e:
             logger.error(f"Failed to initialize Kafka producer: {str(e)}")
             self.producer = None
@@ -36,6 +113,9 @@ class KafkaService:
         """
         Publish image processing status to Kafka
         
+        The message is queued for a background sender thread so the caller
+        never waits on the broker; call flush() to wait for outstanding messages.
+        
         Args:
             workspace (str): GeoServer workspace name
             store_name (str): GeoServer store name
@@ -50,37 +130,57 @@ class KafkaService:
             return False
         
         try:
-            message = {
-                "workspace": workspace,
-                "store_name": store_name,
-                "layer_type": layer_type,
-                "status": status,
-                "timestamp": datetime.utcnow().isoformat() + "Z",
-                "original_layer": original_layer
-            }
-            
-            if status == "success" and file_path:
-                message["file_path"] = file_path
-            elif status == "failed" and error_message:
-                message["error_message"] = error_message
+            message = self._build_message(
+                workspace, store_name, layer_type, status,
+                original_layer, file_path, error_message
+            )
             
             # Use workspace:store_name as message key for partitioning
-            message_key = f"{workspace}:{store_name}"
+            message_key = f"{workspace}:{store_name}".encode('utf-8')
+            
+            with self._lock:
+                # Checked again under the lock in case close() ran meanwhile
+                if not self.producer:
+                    logger.warning("Kafka producer not available, skipping message publication")
+                    return False
+                self._queue.put_nowait((message_key, message))
+            return True
+            
+        except queue.Full:
+            logger.error(f"Kafka send queue full, dropping message for {workspace}:{store_name}")
+            return False
+        except Exception as e:
+            logger.error(f"Unexpected error publishing to Kafka: {str(e)}")
+            return False
+    
+    def publish_sync(self, workspace, store_name, layer_type, status, 
+                     original_layer, file_path=None, error_message=None):
+        """
+        Publish image processing status and wait for broker acknowledgement
+        
+        Same arguments as publish_processing_status, for callers that need
+        confirmation the message was written before continuing
+        """
+        if not self.producer:
+            logger.warning("Kafka producer not available, skipping message publication")
+            return False
+        
+        try:
+            message = self._build_message(
+                workspace, store_name, layer_type, status,
+                original_layer, file_path, error_message
+            )
             
             future = self.producer.send(
                 self.topic,
-                key=message_key,
+                key=f"{workspace}:{store_name}".encode('utf-8'),
                 value=message
             )
             
             # Wait for message to be sent (with timeout)
             record_metadata = future.get(timeout=10)
-            
-            logger.info(f"Kafka message sent successfully:")
-            logger.info(f"Topic: {record_metadata.topic}")
-            logger.info(f"Partition: {record_metadata.partition}")
-            logger.info(f"Offset: {record_metadata.offset}")
-            logger.info(f"Message: {json.dumps(message, indent=2)}")
+            self._on_send_success(record_metadata)
+            logger.info(f"Message: {orjson.dumps(message, option=orjson.OPT_INDENT_2).decode('utf-8')}")
             
             return True
             
@@ -91,6 +191,59 @@ class KafkaService:
             logger.error(f"Unexpected error publishing to Kafka: {str(e)}")
             return False
     
+    def _build_message(self, workspace, store_name, layer_type, status,
+                       original_layer, file_path=None, error_message=None):
+        """Build the status message payload"""
+        message = {
+            "workspace": workspace,
+            "store_name": store_name,
+            "layer_type": layer_type,
+            "status": status,
+            "timestamp": datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT),
+            "original_layer": original_layer
+        }
+        
+        if status == "success" and file_path:
+            message["file_path"] = file_path
+        elif status == "failed" and error_message:
+            message["error_message"] = error_message
+        
+        return message
+    
+    def _send_queued_messages(self, producer):
+        """Sender thread: hand queued messages to producer until stopped"""
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                
+                message_key, message = item
+                future = producer.send(
+                    self.topic,
+                    key=message_key,
+                    value=message
+                )
+                
+                # Delivery is reported asynchronously so the producer can batch messages
+                future.add_callback(self._on_send_success)
+                future.add_errback(self._on_send_error)
+            except Exception as e:
+                logger.error(f"Unexpected error publishing to Kafka: {str(e)}")
+            finally:
+                self._queue.task_done()
+    
+    def _on_send_success(self, record_metadata):
+        """Log delivery of a Kafka message"""
+        logger.info(
+            f"Kafka message sent successfully: topic={record_metadata.topic} "
+            f"partition={record_metadata.partition} offset={record_metadata.offset}"
+        )
+    
+    def _on_send_error(self, exc):
+        """Log failed delivery of a Kafka message"""
+        logger.error(f"Kafka publishing error: {str(exc)}")
+    
     def publish_success(self, workspace, store_name, layer_type, original_layer, file_path):
         """Publish success status"""
         return self.publish_processing_status(
@@ -113,15 +266,34 @@ class KafkaService:
             error_message=error_message
         )
     
+    def flush(self, timeout=10):
+        """Block until all queued and buffered messages have been sent"""
+        producer, sender = self.producer, self._sender
+        if producer:
+            # Only a running sender drains the queue; joining without one never returns
+            if sender and sender.is_alive():
+                self._queue.join()
+            try:
+                producer.flush(timeout=timeout)
+            except KafkaError as e:
+                logger.error(f"Error flushing Kafka producer: {str(e)}")
+    
     def close(self):
-        """Close Kafka producer connection"""
-        if self.producer:
+        """Send the queued messages, then close the Kafka producer connection"""
+        with self._lock:
+            self._closed = True
+            producer, self.producer = self.producer, None
+            sender, self._sender = self._sender, None
+            if sender:
+                self._queue.put(_STOP)
+        
+        if sender:
+            sender.join(timeout=10)
+        
+        if producer:
             try:
-                self.producer.close()
+                producer.flush(timeout=10)
+                producer.close()
                 logger.info("Kafka producer connection closed")
             except Exception as e:
                 logger.error(f"Error closing Kafka producer: {str(e)}")
-    
-    def __del__(self):
-        """Ensure producer is closed when object is destroyed"""
-        self.close()
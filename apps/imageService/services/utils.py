@@ -0,0 +1,411 @@
+import os
+import logging
+import numpy as np
+from osgeo import gdal, gdal_array
+from django.conf import settings
+
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+logger = logging.getLogger(__name__)
+
+USE_CUPY = getattr(settings, 'NDVI_USE_CUPY', False)
+if USE_CUPY:
+    try:
+        import cupy as cp
+    except ImportError:
+        logger.warning("NDVI_USE_CUPY is set but cupy is not installed, computing on the CPU")
+        USE_CUPY = False
+
+# Whether a compiled kernel is available; otherwise normalized_difference runs on NumPy
+HAVE_KERNEL = USE_CUPY or HAVE_NUMBA
+
+# GDAL block cache size, large enough to keep reused input tiles resident
+GDAL_CACHE_MAX = 1 << 30
+
+
+def configure_gdal():
+    """Process-wide GDAL settings, applied once at startup"""
+    gdal.SetConfigOption('GDAL_NUM_THREADS', 'ALL_CPUS')
+    # Skips the directory listing on open; sidecar files (.aux.xml, .tfw, .prj,
+    # .msk, .ovr) are still probed for directly, unlike with EMPTY_DIR
+    gdal.SetConfigOption('GDAL_DISABLE_READDIR_ON_OPEN', 'TRUE')
+    gdal.SetCacheMax(GDAL_CACHE_MAX)
+
+
+def open_raster(path):
+    """Open a raster read-only with multi-threaded block decoding"""
+    return gdal.OpenEx(path, gdal.OF_RASTER | gdal.OF_READONLY, open_options=['NUM_THREADS=ALL_CPUS'])
+
+
+def open_input_file(file_path):
+    """Open the input raster, returns the dataset or None"""
+    try:
+        if not os.path.exists(file_path):
+            logger.error(f"Input file not found: {file_path}")
+            return None
+        
+        dataset = open_raster(file_path)
+        if dataset is None:
+            logger.error(f"Cannot open file with GDAL: {file_path}")
+        return dataset
+        
+    except Exception as e:
+        logger.error(f"File validation error: {str(e)}")
+        return None
+
+
+def generate_output_path(input_path, layer_name, suffix):
+    """Generate output file path with suffix"""
+    input_dir = os.path.dirname(input_path)
+    output_filename = f"{layer_name}{suffix}.tif"
+    return os.path.join(input_dir, output_filename)
+
+
+def cleanup_file(file_path):
+    """Remove file if it exists"""
+    try:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+            logger.info(f"Cleaned up file: {file_path}")
+    except Exception as e:
+        logger.warning(f"Failed to cleanup file {file_path}: {str(e)}")
+
+
+def band_dtype(band):
+    """NumPy dtype matching a band's native data type"""
+    return np.dtype(gdal_array.GDALTypeCodeToNumericTypeCode(band.DataType))
+
+
+# Tile size used when the input's blocks are not valid GeoTIFF tiles (e.g. strips)
+DEFAULT_BLOCK_SIZE = 256
+
+# Largest input block reused as an output tile, and the most rows read per window
+MAX_BLOCK_SIZE = 1024
+
+
+def output_block_size(band):
+    """
+    Tile size for outputs derived from band: the band's own block size when the
+    input is tiled and GeoTIFF accepts it as a tile size (multiples of 16, at most
+    MAX_BLOCK_SIZE), else DEFAULT_BLOCK_SIZE
+    """
+    block_x, block_y = band.GetBlockSize()
+    tiled = block_x < band.XSize
+    if (tiled and block_x <= MAX_BLOCK_SIZE and block_y <= MAX_BLOCK_SIZE
+            and block_x % 16 == 0 and block_y % 16 == 0):
+        return block_x, block_y
+    return DEFAULT_BLOCK_SIZE, DEFAULT_BLOCK_SIZE
+
+
+def creation_options(block_x, block_y, *extra):
+    """GTiff creation options for processed outputs tiled block_x by block_y"""
+    return [
+        'COMPRESS=ZSTD',
+        'ZSTD_LEVEL=1',
+        'PREDICTOR=2',
+        'TILED=YES',
+        f'BLOCKXSIZE={block_x}',
+        f'BLOCKYSIZE={block_y}',
+        'NUM_THREADS=ALL_CPUS',
+        'BIGTIFF=IF_SAFER',
+        *extra
+    ]
+
+
+def window_size(band):
+    """
+    Processing window for a band: its block size rounded up to whole output tiles
+    so every window read covers complete source blocks and writes complete output
+    tiles, with at most MAX_BLOCK_SIZE rows (rounded up to a tile) per window
+    """
+    block_x, block_y = band.GetBlockSize()
+    out_x, out_y = output_block_size(band)
+    # Strips span the full width, so tall strips (or a single strip) are read
+    # at most MAX_BLOCK_SIZE rows at a time to keep the windows bounded
+    block_y = min(block_y, MAX_BLOCK_SIZE)
+    win_x = -(-block_x // out_x) * out_x
+    win_y = -(-block_y // out_y) * out_y
+    return win_x, win_y
+
+
+def block_windows(cols, rows, win_x, win_y):
+    """Yield (xoff, yoff, xsize, ysize) windows covering a cols x rows raster"""
+    for yoff in range(0, rows, win_y):
+        ysize = min(win_y, rows - yoff)
+        for xoff in range(0, cols, win_x):
+            yield xoff, yoff, min(win_x, cols - xoff), ysize
+
+
+# Number of entries in a color lookup table spanning index values -1..1
+LUT_SIZE = 256
+
+
+def build_color_lut(values, colors):
+    """Sample a color ramp at LUT_SIZE evenly spaced index values in [-1, 1]"""
+    samples = np.linspace(-1.0, 1.0, LUT_SIZE)
+    return np.stack(
+        [np.interp(samples, values, colors[:, channel]) for channel in range(3)],
+        axis=1
+    ).astype(np.uint8)
+
+
+def lut_index(values):
+    """Map index values in [-1, 1] to the nearest color lookup table positions"""
+    positions = (values + 1.0) * ((LUT_SIZE - 1) / 2.0)
+    # Rounded rather than truncated so each value takes its nearest LUT sample
+    np.rint(positions, out=positions)
+    np.clip(positions, 0, LUT_SIZE - 1, out=positions)
+    return positions.astype(np.uint8)
+
+
+# Index rasters are stored as Int16 with value = round(index * INDEX_SCALE)
+INDEX_SCALE = 10000.0
+INDEX_DTYPE = np.int16
+
+# Written for pixels that are nodata, non-positive or have a zero denominator
+INDEX_NODATA = -32768
+
+if HAVE_NUMBA:
+    @njit(parallel=True, fastmath=True, cache=True, boundscheck=False)
+    def _normalized_difference_kernel(a, b, a_nodata, b_nodata, has_a_nodata, has_b_nodata, out):
+        """Scaled (a - b) / (a + b) with nodata, positivity and clamp checks in a single pass"""
+        rows, cols = a.shape
+        for i in prange(rows):
+            for j in range(cols):
+                # Inputs stay in their native (typically uint16) arrays, the cast happens in registers
+                x = np.float32(a[i, j])
+                y = np.float32(b[i, j])
+                if (has_a_nodata and x == a_nodata) or (has_b_nodata and y == b_nodata):
+                    out[i, j] = INDEX_NODATA
+                elif x > 0 and y > 0:
+                    out[i, j] = round(min(1.0, max(-1.0, (x - y) / (x + y))) * INDEX_SCALE)
+                else:
+                    out[i, j] = INDEX_NODATA
+
+
+if USE_CUPY:
+    # Elementwise kernels compile to a single fused CUDA launch
+    _normalized_difference_gpu = cp.ElementwiseKernel(
+        'T a, U b, float64 a_nodata, float64 b_nodata, bool has_a_nodata, bool has_b_nodata',
+        'int16 out',
+        f'''
+        float x = (float)a;
+        float y = (float)b;
+        if ((has_a_nodata && x == a_nodata) || (has_b_nodata && y == b_nodata) || !(x > 0 && y > 0)) {{
+            out = {INDEX_NODATA};
+        }} else {{
+            out = (short)rintf(fminf(1.0f, fmaxf(-1.0f, (x - y) / (x + y))) * {INDEX_SCALE}f);
+        }}
+        ''',
+        'normalized_difference'
+    )
+
+
+def _nodata_as(nodata, dtype):
+    """
+    A nodata value converted to dtype, as a float, so the kernels' float comparisons
+    match pixels stored in that dtype; None if unset or if no pixel of dtype can hold it
+    """
+    if nodata is None:
+        return None
+    
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        if not float(nodata).is_integer() or not info.min <= nodata <= info.max:
+            return None
+    
+    return float(dtype.type(nodata))
+
+
+def _normalized_difference_numpy(a, b, a_nodata, b_nodata, out):
+    """NumPy version of the normalized difference kernel, used when no kernel is available"""
+    # Window-sized scratch; every ufunc below writes into it in place.
+    # Computed in float32 so unsigned inputs cannot wrap around
+    index = np.empty(out.shape, dtype=np.float32)
+    denominator = np.empty(out.shape, dtype=np.float32)
+    np.add(a, b, out=denominator, dtype=np.float32)
+    
+    # A single validity mask; invalid pixels are selected away instead of fancy-indexed
+    safe = (a > 0) & (b > 0) & (denominator != 0)
+    if a_nodata is not None:
+        safe &= (a != a_nodata)
+    if b_nodata is not None:
+        safe &= (b != b_nodata)
+    
+    np.subtract(a, b, out=index, dtype=np.float32)
+    # Both inputs are positive where safe, so the ratio already lies in (-1, 1)
+    np.divide(index, denominator, out=index, where=safe)
+    np.multiply(index, INDEX_SCALE, out=index)
+    np.rint(index, out=index)
+    
+    out.fill(INDEX_NODATA)
+    np.copyto(out, index, casting='unsafe', where=safe)
+    
+    return out
+
+
+def normalized_difference(a, b, a_nodata, b_nodata, out):
+    """
+    Compute scaled (a - b) / (a + b) into the INDEX_DTYPE out array,
+    on the GPU when NDVI_USE_CUPY is enabled, else with the Numba kernel,
+    falling back to NumPy when neither is available
+    """
+    # Pixels are compared against nodata as stored, in the array's own dtype
+    a_nodata = _nodata_as(a_nodata, a.dtype)
+    b_nodata = _nodata_as(b_nodata, b.dtype)
+    
+    if not HAVE_KERNEL:
+        return _normalized_difference_numpy(a, b, a_nodata, b_nodata, out)
+    
+    args = (
+        a_nodata if a_nodata is not None else 0.0,
+        b_nodata if b_nodata is not None else 0.0,
+        a_nodata is not None,
+        b_nodata is not None,
+    )
+    
+    if USE_CUPY:
+        out[...] = _normalized_difference_gpu(cp.asarray(a), cp.asarray(b), *args).get()
+        return out
+    
+    _normalized_difference_kernel(a, b, *args, out)
+    return out
+
+
+def calculate_indices(input_ds, targets):
+    """
+    Write normalized difference rasters for input_ds window by window
+    targets is a list of (output_path, a_band, b_band) with 1-based band numbers,
+    each output receiving scaled (a - b) / (a + b); a band shared by several
+    targets is read once per window
+    Returns False if a required band is missing
+    """
+    output_bands = []
+    output_datasets = []
+    
+    try:
+        needed = sorted({number for _, a, b in targets for number in (a, b)})
+        band_count = input_ds.RasterCount
+        
+        if band_count < needed[-1]:
+            logger.error(f"Insufficient bands. Found {band_count}, need at least {needed[-1]}")
+            return False
+        
+        bands = {number: input_ds.GetRasterBand(number) for number in needed}
+        
+        if any(band is None for band in bands.values()):
+            logger.error(f"Required bands {tuple(needed)} not accessible")
+            return False
+        
+        cols = input_ds.RasterXSize
+        rows = input_ds.RasterYSize
+        
+        nodata = {number: band.GetNoDataValue() for number, band in bands.items()}
+        
+        # Output tiles match the input blocks so each window maps onto whole tiles
+        reference_band = bands[needed[0]]
+        block_x, block_y = output_block_size(reference_band)
+        
+        driver = gdal.GetDriverByName('GTiff')
+        for output_path, _, _ in targets:
+            output_ds = driver.Create(
+                output_path, cols, rows, 1, gdal.GDT_Int16,
+                options=creation_options(block_x, block_y)
+            )
+            output_ds.SetGeoTransform(input_ds.GetGeoTransform())
+            output_ds.SetProjection(input_ds.GetProjection())
+            
+            output_band = output_ds.GetRasterBand(1)
+            output_band.SetNoDataValue(INDEX_NODATA)
+            output_band.SetScale(1.0 / INDEX_SCALE)
+            output_band.SetOffset(0.0)
+            
+            output_datasets.append(output_ds)
+            output_bands.append(output_band)
+        
+        # Buffers are allocated once and reused for every window
+        win_x, win_y = window_size(reference_band)
+        bands_buf = np.empty(
+            (len(needed), win_y, win_x),
+            dtype=np.result_type(*(band_dtype(band) for band in bands.values()))
+        )
+        index_buf = np.empty((win_y, win_x), dtype=INDEX_DTYPE)
+        
+        # All bands come from one dataset-level read, which hands their blocks to the
+        # NUM_THREADS decoders together; separate band reads would each decode a single
+        # block, and a dataset must not be read from several threads
+        for xoff, yoff, xsize, ysize in block_windows(cols, rows, win_x, win_y):
+            window = input_ds.ReadAsArray(
+                xoff, yoff, xsize, ysize, buf_obj=bands_buf[:, :ysize, :xsize],
+                band_list=needed
+            )
+            data = dict(zip(needed, window))
+            
+            for (_, a, b), output_band in zip(targets, output_bands):
+                index = normalized_difference(
+                    data[a], data[b], nodata[a], nodata[b], index_buf[:ysize, :xsize]
+                )
+                output_band.WriteArray(index, xoff, yoff)
+            
+            # Each tile is written once, release a finished row of tiles
+            # so it does not push input blocks out of the GDAL cache
+            if xoff + xsize == cols:
+                for output_band in output_bands:
+                    output_band.FlushCache()
+        
+        for output_ds in output_datasets:
+            output_ds.FlushCache()
+        
+        return True
+        
+    finally:
+        output_bands.clear()
+        output_datasets.clear()
+
+
+def apply_color_lut(index_path, output_rgb_path, lut):
+    """Style the scaled index raster at index_path through lut into an RGB GeoTIFF"""
+    index_ds = gdal.Open(index_path, gdal.GA_ReadOnly)
+    index_band = index_ds.GetRasterBand(1)
+    nodata = index_band.GetNoDataValue()
+    scale = index_band.GetScale() or 1.0
+    
+    rows = index_ds.RasterYSize
+    cols = index_ds.RasterXSize
+    
+    driver = gdal.GetDriverByName('GTiff')
+    block_x, block_y = output_block_size(index_band)
+    out_ds = driver.Create(output_rgb_path, cols, rows, 3, gdal.GDT_Byte,
+                           options=creation_options(block_x, block_y, 'PHOTOMETRIC=RGB'))
+    
+    out_ds.SetGeoTransform(index_ds.GetGeoTransform())
+    out_ds.SetProjection(index_ds.GetProjection())
+    
+    out_bands = [out_ds.GetRasterBand(k) for k in (1, 2, 3)]
+    
+    # Styling runs one output block at a time so the index and RGB tiles stay
+    # in cache and each WriteArray fills exactly one compressed block
+    for xoff, yoff, xsize, ysize in block_windows(cols, rows, block_x, block_y):
+        tile_scaled = index_band.ReadAsArray(xoff, yoff, xsize, ysize)
+        tile_index = tile_scaled.astype(np.float32) * scale
+        
+        # One gather yields all three channels; nodata pixels are blanked in place
+        tile_rgb = lut[lut_index(tile_index)]
+        if nodata is not None:
+            tile_rgb[tile_scaled == nodata] = 0
+        
+        for k, out_band in enumerate(out_bands):
+            out_band.WriteArray(np.ascontiguousarray(tile_rgb[..., k]), xoff, yoff)
+        
+        if xoff + xsize == cols:
+            for out_band in out_bands:
+                out_band.FlushCache()
+    
+    out_ds.FlushCache()
+    
+    out_ds = None
+    index_ds = None
@@ -1,3 +1,395 @@
-from django.test import TestCase
+import os
+import tempfile
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from django.test import SimpleTestCase
+from osgeo import gdal
+from rest_framework.test import APIRequestFactory
+
+from . import views
+
+from .services import geoserver_service, indices_processor, kafka_service, utils
+from .services.geoserver_service import GeoServerService, STORE_EXISTS
+from .services.indices_processor import IndicesProcessor
+from .services.kafka_service import KafkaService
+from .services.ndvi_processor import NDVIProcessor
+from .services.ndwi_processor import NDWIProcessor
+from .services.utils import (
+    build_color_lut, lut_index, normalized_difference, INDEX_DTYPE, INDEX_NODATA, LUT_SIZE
+)
+
+
+def _window(dtype, nodata, seed, shape=(64, 48)):
+    """Random window with nodata and zero pixels in known places"""
+    rng = np.random.default_rng(seed)
+    if np.issubdtype(dtype, np.floating):
+        window = rng.uniform(-100.0, 10000.0, shape).astype(dtype)
+    else:
+        info = np.iinfo(dtype)
+        window = rng.integers(max(info.min, -1000), min(info.max, 10000), shape).astype(dtype)
+        if not info.min <= nodata <= info.max:
+            nodata = 0
+    window[0, :] = nodata
+    window[:, 0] = 0
+    return window
+
+
+def _compute(a, b, a_nodata, b_nodata, use_kernel):
+    out = np.empty(a.shape, dtype=INDEX_DTYPE)
+    with mock.patch.object(utils, 'HAVE_KERNEL', use_kernel):
+        return normalized_difference(a, b, a_nodata, b_nodata, out)
+
+
+class NormalizedDifferenceTests(SimpleTestCase):
+
+    def test_known_values(self):
+        a = np.array([[3, 1, 0, 9, 5]], dtype=np.uint16)
+        b = np.array([[1, 3, 4, 9, 9]], dtype=np.uint16)
+        result = _compute(a, b, None, 9, use_kernel=False)
+        np.testing.assert_array_equal(
+            result, [[5000, -5000, INDEX_NODATA, INDEX_NODATA, INDEX_NODATA]]
+        )
+
+    @skipUnless(utils.HAVE_KERNEL, "no compiled normalized difference kernel")
+    def test_numpy_fallback_matches_kernel(self):
+        cases = [
+            (np.uint16, 65535),
+            (np.int16, -9999),
+            (np.float32, -9999.0),
+            # Not exactly representable in float32
+            (np.float32, 3.3),
+            (np.float32, 0.1),
+            (np.uint8, 255),
+            # Outside the dtype's range, so nothing is masked as nodata
+            (np.uint16, -1),
+        ]
+        for seed, (dtype, nodata) in enumerate(cases):
+            with self.subTest(dtype=np.dtype(dtype).name):
+                a = _window(dtype, nodata, seed)
+                b = _window(dtype, nodata, seed + 100)
+                b[5, :] = b[0, 1]
+
+                kernel = _compute(a, b, nodata, nodata, use_kernel=True)
+                fallback = _compute(a, b, nodata, nodata, use_kernel=False)
+
+                np.testing.assert_array_equal(kernel == INDEX_NODATA, fallback == INDEX_NODATA)
+                self.assertLessEqual(
+                    np.abs(kernel.astype(np.int32) - fallback.astype(np.int32)).max(), 1
+                )
+
+
+class IndexCalculationTests(SimpleTestCase):
+    """NDVI and NDWI rasters are written with the right band order and nodata"""
+
+    def setUp(self):
+        self.input_ds = gdal.GetDriverByName('MEM').Create('', 40, 30, 8, gdal.GDT_UInt16)
+        values = {3: 1000, 4: 2000, 8: 6000}
+        for number, value in values.items():
+            band = self.input_ds.GetRasterBand(number)
+            data = np.full((30, 40), value, dtype=np.uint16)
+            data[0, 0] = 0
+            band.WriteArray(data)
+
+    def _read(self, path):
+        ds = gdal.Open(path)
+        band = ds.GetRasterBand(1)
+        return band.ReadAsArray(), band.GetNoDataValue(), band.GetScale()
+
+    def test_ndvi(self):
+        path = '/vsimem/test_NDVI.tif'
+        self.assertTrue(NDVIProcessor()._calculate_ndvi(self.input_ds, path))
+        data, nodata, scale = self._read(path)
+        self.assertEqual(nodata, INDEX_NODATA)
+        self.assertEqual(data[0, 0], INDEX_NODATA)
+        # (6000 - 2000) / (6000 + 2000)
+        self.assertAlmostEqual(data[10, 10] * scale, 0.5)
+        gdal.Unlink(path)
+
+    def test_ndwi(self):
+        path = '/vsimem/test_NDWI.tif'
+        self.assertTrue(NDWIProcessor()._calculate_ndwi(self.input_ds, path))
+        data, nodata, scale = self._read(path)
+        self.assertEqual(nodata, INDEX_NODATA)
+        self.assertEqual(data[0, 0], INDEX_NODATA)
+        # (1000 - 6000) / (1000 + 6000)
+        self.assertAlmostEqual(data[10, 10] * scale, -5000 / 7000, places=4)
+        gdal.Unlink(path)
+
+
+class ColorLutTests(SimpleTestCase):
+
+    def test_lut_index_endpoints(self):
+        indices = lut_index(np.array([-1.0, 0.0, 1.0], dtype=np.float32))
+        self.assertEqual(indices[0], 0)
+        self.assertIn(indices[1], (LUT_SIZE // 2 - 1, LUT_SIZE // 2))
+        self.assertEqual(indices[2], LUT_SIZE - 1)
+
+    def test_lut_index_clips_out_of_range(self):
+        indices = lut_index(np.array([-1.5, 1.5], dtype=np.float32))
+        np.testing.assert_array_equal(indices, [0, LUT_SIZE - 1])
+
+    def test_build_color_lut(self):
+        values = np.array([-1.0, 0.0, 1.0])
+        colors = np.array([[0, 0, 0], [100, 100, 100], [200, 200, 200]], dtype=np.uint8)
+        lut = build_color_lut(values, colors)
+
+        self.assertEqual(lut.shape, (LUT_SIZE, 3))
+        self.assertEqual(lut.dtype, np.uint8)
+
+        rgb = lut[lut_index(np.array([-1.0, 0.0, 1.0], dtype=np.float32))]
+        np.testing.assert_array_equal(rgb, colors)
+
+
+class KafkaServiceTests(SimpleTestCase):
+
+    def setUp(self):
+        self.calls = mock.Mock()
+        producer_patcher = mock.patch.object(kafka_service, 'KafkaProducer', self.calls.producer)
+        atexit_patcher = mock.patch.object(kafka_service, 'atexit', self.calls.atexit)
+        producer_patcher.start()
+        atexit_patcher.start()
+        self.addCleanup(producer_patcher.stop)
+        self.addCleanup(atexit_patcher.stop)
+
+        self.service = KafkaService()
+        self.addCleanup(self.service.close)
+        self.producer = self.calls.producer.return_value
+
+    def test_close_hook_registered_after_producer(self):
+        # atexit runs last-registered-first, so close() must follow KafkaProducer's own hook
+        names = [name for name, _, _ in self.calls.mock_calls if name in ('producer', 'atexit.register')]
+        self.assertEqual(names, ['producer', 'atexit.register'])
+        self.calls.atexit.register.assert_called_once_with(self.service.close)
+
+    def test_close_sends_queued_messages(self):
+        for n in range(3):
+            self.assertTrue(self.service.publish_success(
+                workspace='ws', store_name=f'layer{n}_NDVI', layer_type='NDVI',
+                original_layer=f'layer{n}', file_path=f'/data/layer{n}_NDVI_styled.tif'
+            ))
+
+        self.service.close()
+
+        keys = [call.kwargs['key'] for call in self.producer.send.call_args_list]
+        self.assertEqual(keys, [b'ws:layer0_NDVI', b'ws:layer1_NDVI', b'ws:layer2_NDVI'])
+        names = [name for name, _, _ in self.producer.mock_calls]
+        self.assertLess(len(names) - 1 - names[::-1].index('send'), names.index('close'))
+
+    def test_publish_after_close_is_rejected(self):
+        self.service.close()
+
+        self.assertFalse(self.service.publish_failure(
+            workspace='ws', store_name='layer_NDVI', layer_type='NDVI',
+            original_layer='layer', error_message='failed'
+        ))
+        # Must return rather than wait on a queue nobody drains
+        self.service.flush()
+        self.producer.send.assert_not_called()
+
+
+class IndicesProcessorTests(SimpleTestCase):
+    """process_indices leaves no partial outputs behind when it fails"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.input_path = os.path.join(self.tmp_dir.name, 'layer.tif')
+
+        patcher = mock.patch.object(indices_processor, 'open_input_file', return_value=mock.Mock())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _path(self, suffix):
+        return os.path.join(self.tmp_dir.name, f'layer{suffix}.tif')
+
+    def _write_outputs(self, input_ds, targets):
+        for output_path, _, _ in targets:
+            open(output_path, 'w').close()
+        return True
+
+    def test_calculation_targets(self):
+        with mock.patch.object(indices_processor, 'calculate_indices', return_value=False) as calculate:
+            result = IndicesProcessor().process_indices(self.input_path, 'ws', 'layer', ['NDVI', 'NDWI'])
+
+        self.assertIsNone(result)
+        self.assertEqual(calculate.call_args.args[1], [
+            (self._path('_NDVI'), 8, 4),
+            (self._path('_NDWI'), 3, 8),
+        ])
+
+    def test_existing_styled_file_is_kept(self):
+        open(self._path('_NDWI_styled'), 'w').close()
+
+        with mock.patch.object(indices_processor, 'calculate_indices') as calculate:
+            result = IndicesProcessor().process_indices(self.input_path, 'ws', 'layer', ['NDVI', 'NDWI'])
+
+        self.assertIsNone(result)
+        calculate.assert_not_called()
+        self.assertTrue(os.path.exists(self._path('_NDWI_styled')))
+
+    def test_styling_error_removes_outputs(self):
+        def style(index_path, styled_path, lut):
+            open(styled_path, 'w').close()
+            raise RuntimeError("write failed")
+
+        with mock.patch.object(indices_processor, 'calculate_indices', side_effect=self._write_outputs), \
+                mock.patch.object(indices_processor, 'apply_color_lut', side_effect=style):
+            result = IndicesProcessor().process_indices(self.input_path, 'ws', 'layer', ['NDVI', 'NDWI'])
+
+        self.assertIsNone(result)
+        self.assertEqual(os.listdir(self.tmp_dir.name), [])
+
+    def test_success_keeps_only_styled_outputs(self):
+        def style(index_path, styled_path, lut):
+            open(styled_path, 'w').close()
+
+        with mock.patch.object(indices_processor, 'calculate_indices', side_effect=self._write_outputs), \
+                mock.patch.object(indices_processor, 'apply_color_lut', side_effect=style):
+            result = IndicesProcessor().process_indices(self.input_path, 'ws', 'layer', ['NDVI'])
+
+        self.assertEqual(result, {'NDVI': self._path('_NDVI_styled')})
+        self.assertEqual(os.listdir(self.tmp_dir.name), ['layer_NDVI_styled.tif'])
+
+
+class IndicesProcessingViewTests(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.kafka = mock.Mock()
+        self.geoserver = mock.Mock()
+        self.geoserver.get_layer_file_path.return_value = '/data/layer.tif'
+        self.geoserver.check_layer_exists.return_value = False
+        self.processor = mock.Mock()
+        self.processor.process_indices.return_value = {
+            'NDVI': '/data/layer_NDVI_styled.tif',
+            'NDWI': '/data/layer_NDWI_styled.tif',
+        }
+
+        for name, value in (
+            ('KafkaService', mock.Mock(**{'get_instance.return_value': self.kafka})),
+            ('GeoServerService', mock.Mock(**{'get_instance.return_value': self.geoserver})),
+            ('IndicesProcessor', mock.Mock(return_value=self.processor)),
+        ):
+            patcher = mock.patch.object(views, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _post(self, data):
+        request = self.factory.post('/process-indices/', data, format='json')
+        return views.IndicesProcessingView.as_view()(request)
+
+    def test_parse_indices(self):
+        view = views.IndicesProcessingView()
+        self.assertEqual(view._parse_indices(['ndvi', 'NDWI', 'Ndvi']), ['NDVI', 'NDWI'])
+        self.assertEqual(view._parse_indices(['ndvi', 'evi']), [])
+        self.assertEqual(view._parse_indices(['ndvi', 1]), [])
+        self.assertEqual(view._parse_indices('ndvi'), [])
+        self.assertEqual(view._parse_indices([]), [])
+
+    def test_invalid_indices(self):
+        response = self._post({'layer_name': 'ws:layer', 'indices': ['evi']})
+
+        self.assertEqual(response.status_code, 400)
+        self.processor.process_indices.assert_not_called()
+
+    def test_existing_layer_conflict(self):
+        self.geoserver.check_layer_exists.side_effect = lambda workspace, name: name == 'layer_NDWI'
+
+        response = self._post({'layer_name': 'ws:layer'})
+
+        self.assertEqual(response.status_code, 409)
+        self.processor.process_indices.assert_not_called()
+        self.assertEqual(
+            [call.kwargs['store_name'] for call in self.kafka.publish_failure.call_args_list],
+            ['layer_NDVI', 'layer_NDWI']
+        )
+
+    def test_success(self):
+        self.geoserver.publish_many.return_value = [
+            ('ws:layer_NDVI', True, None),
+            ('ws:layer_NDWI', True, None),
+        ]
+
+        response = self._post({'layer_name': 'ws:layer', 'indices': ['ndvi', 'ndwi']})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [layer['layer_name'] for layer in response.data['layers']],
+            ['ws:layer_NDVI', 'ws:layer_NDWI']
+        )
+        self.assertEqual(self.kafka.publish_success.call_count, 2)
+        self.kafka.publish_failure.assert_not_called()
+
+    def test_partial_publish_failure(self):
+        self.geoserver.publish_many.return_value = [
+            ('ws:layer_NDVI', True, None),
+            ('ws:layer_NDWI', False, 'Failed to publish layer ws:layer_NDWI'),
+        ]
+
+        with mock.patch.object(views, 'cleanup_file') as cleanup:
+            response = self._post({'layer_name': 'ws:layer'})
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(
+            [layer['layer_name'] for layer in response.data['layers']], ['ws:layer_NDVI']
+        )
+        cleanup.assert_called_once_with('/data/layer_NDWI_styled.tif')
+        self.kafka.publish_success.assert_called_once()
+        self.assertEqual(self.kafka.publish_success.call_args.kwargs['store_name'], 'layer_NDVI')
+        self.kafka.publish_failure.assert_called_once()
+        self.assertEqual(self.kafka.publish_failure.call_args.kwargs['store_name'], 'layer_NDWI')
+
+
+class GeoServerPublishTests(SimpleTestCase):
+
+    def setUp(self):
+        self.http = mock.Mock()
+        self.path_cache = mock.Mock()
+        with mock.patch.object(geoserver_service, 'get_session', return_value=self.http), \
+                mock.patch.object(geoserver_service, 'caches', {'geoserver': self.path_cache}):
+            self.service = GeoServerService()
+
+    def _response(self, status_code, content=b''):
+        return mock.Mock(status_code=status_code, content=content)
+
+    def test_store_exists_on_conflict(self):
+        self.http.post.return_value = self._response(409)
+
+        self.assertIs(self.service._create_coverage_store('ws', 'layer', '/data/layer.tif'), STORE_EXISTS)
+        self.assertFalse(self.service.publish_ndvi_layer('ws', 'layer', '/data/layer.tif'))
+        self.assertEqual(self.http.post.call_count, 2)
+        self.path_cache.delete.assert_not_called()
+
+    def test_store_exists_on_server_error(self):
+        self.http.post.return_value = self._response(
+            500, b"Store 'layer' already exists in workspace 'ws'"
+        )
+        self.assertIs(self.service._create_coverage_store('ws', 'layer', '/data/layer.tif'), STORE_EXISTS)
+
+        self.http.post.return_value = self._response(500, b'Internal error')
+        self.assertIs(self.service._create_coverage_store('ws', 'layer', '/data/layer.tif'), False)
+
+    def test_publish_invalidates_cached_path(self):
+        self.http.post.side_effect = [self._response(201), mock.Mock()]
+
+        self.assertTrue(self.service.publish_ndvi_layer('ws', 'layer', '/data/layer.tif'))
+        self.path_cache.delete.assert_called_once_with('ws:layer')
+
+    def test_publish_many_keeps_order(self):
+        def publish(workspace, layer_name, file_path):
+            if layer_name == 'b':
+                raise RuntimeError("connection reset")
+            return layer_name != 'c'
+
+        items = [('ws', name, f'/data/{name}.tif') for name in ('a', 'b', 'c', 'd')]
+        with mock.patch.object(self.service, 'publish_ndvi_layer', side_effect=publish) as publish_layer:
+            results = self.service.publish_many(items, max_workers=2)
+
+        self.assertEqual(results, [
+            ('ws:a', True, None),
+            ('ws:b', False, 'connection reset'),
+            ('ws:c', False, 'Failed to publish layer ws:c'),
+            ('ws:d', True, None),
+        ])
+        self.assertEqual(publish_layer.call_count, 4)
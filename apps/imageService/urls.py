@@ -1,7 +1,8 @@
 from django.urls import path
-from .views import NDVIProcessingView, NDWIProcessingView
+from .views import NDVIProcessingView, NDWIProcessingView, IndicesProcessingView
 
 urlpatterns = [
     path('process-ndvi/', NDVIProcessingView.as_view(), name='process-ndvi'),
     path('process-ndwi/', NDWIProcessingView.as_view(), name='process-ndwi'),
+    path('process-indices/', IndicesProcessingView.as_view(), name='process-indices'),
 ]
@@ -5,15 +5,20 @@ from rest_framework.parsers import JSONParser
 from django.conf import settings
 import re
 import logging
-from .services import GeoServerService, NDVIProcessor, NDWIProcessor, KafkaService
+from .services import GeoServerService, NDVIProcessor, NDWIProcessor, IndicesProcessor, KafkaService
+from .services.utils import cleanup_file
 
 logger = logging.getLogger(__name__)
 
+_LAYER_RE = re.compile(r'^[a-zA-Z0-9_-]+:[a-zA-Z0-9_-]+\Z')
+
+SUPPORTED_INDICES = ('NDVI', 'NDWI')
+
 class NDVIProcessingView(APIView):
     parser_classes = [JSONParser]
     
     def post(self, request):
-        kafka_service = KafkaService()
+        kafka_service = KafkaService.get_instance()
         workspace = None
         layer = None
         ndvi_layer_name = None
@@ -29,7 +34,7 @@ class NDVIProcessingView(APIView):
             workspace, layer = layer_name.split(':')
             ndvi_layer_name = f"{layer}_NDVI"
             
-            geoserver_service = GeoServerService()
+            geoserver_service = GeoServerService.get_instance()
             file_path = geoserver_service.get_layer_file_path(workspace, layer)
             
             if not file_path:
@@ -123,14 +128,9 @@ class NDVIProcessingView(APIView):
             return Response({
                 'error': error_msg
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        finally:
-            kafka_service.close()
     
     def _validate_layer_format(self, layer_name):
-        if not layer_name:
-            return False
-        pattern = r'^[a-zA-Z0-9_-]+:[a-zA-Z0-9_-]+$'
-        return bool(re.match(pattern, layer_name))
+        return bool(layer_name) and _LAYER_RE.match(layer_name) is not None
     
     def _cleanup_ndvi_file(self, file_path):
         try:
@@ -146,7 +146,7 @@ class NDWIProcessingView(APIView):
     parser_classes = [JSONParser]
     
     def post(self, request):
-        kafka_service = KafkaService()
+        kafka_service = KafkaService.get_instance()
         workspace = None
         layer = None
         ndwi_layer_name = None
@@ -162,7 +162,7 @@ class NDWIProcessingView(APIView):
             workspace, layer = layer_name.split(':')
             ndwi_layer_name = f"{layer}_NDWI"
             
-            geoserver_service = GeoServerService()
+            geoserver_service = GeoServerService.get_instance()
             file_path = geoserver_service.get_layer_file_path(workspace, layer)
             
             if not file_path:
@@ -256,14 +256,9 @@ class NDWIProcessingView(APIView):
             return Response({
                 'error': error_msg
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        finally:
-            kafka_service.close()
     
     def _validate_layer_format(self, layer_name):
-        if not layer_name:
-            return False
-        pattern = r'^[a-zA-Z0-9_-]+:[a-zA-Z0-9_-]+$'
-        return bool(re.match(pattern, layer_name))
+        return bool(layer_name) and _LAYER_RE.match(layer_name) is not None
     
     def _cleanup_ndwi_file(self, file_path):
         try:
@@ -273,3 +268,138 @@ class NDWIProcessingView(APIView):
                 logger.info(f"Cleaned up NDWI file: {file_path}")
         except Exception as e:
             logger.warning(f"Failed to cleanup NDWI file: {str(e)}")
+
+
+class IndicesProcessingView(APIView):
+    """Compute several indices for one layer, reading the shared bands only once"""
+    parser_classes = [JSONParser]
+    
+    def post(self, request):
+        kafka_service = KafkaService.get_instance()
+        workspace = None
+        layer = None
+        indices = []
+        
+        try:
+            layer_name = request.data.get('layer_name')
+            
+            if not self._validate_layer_format(layer_name):
+                return Response({
+                    'error': 'Invalid layer format. Expected workspace:layer_name'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            indices = self._parse_indices(request.data.get('indices', ['ndvi', 'ndwi']))
+            
+            if not indices:
+                return Response({
+                    'error': f'Invalid indices. Expected a list drawn from {[i.lower() for i in SUPPORTED_INDICES]}'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            workspace, layer = layer_name.split(':')
+            
+            geoserver_service = GeoServerService.get_instance()
+            file_path = geoserver_service.get_layer_file_path(workspace, layer)
+            
+            if not file_path:
+                error_msg = f'Layer {layer_name} not found in GeoServer'
+                self._publish_failures(kafka_service, workspace, layer, indices, error_msg)
+                return Response({
+                    'error': error_msg
+                }, status=status.HTTP_404_NOT_FOUND)
+            
+            for index in indices:
+                index_layer_name = f"{layer}_{index}"
+                if geoserver_service.check_layer_exists(workspace, index_layer_name):
+                    error_msg = f'{index} layer {workspace}:{index_layer_name} already exists'
+                    self._publish_failures(kafka_service, workspace, layer, indices, error_msg)
+                    return Response({
+                        'error': error_msg
+                    }, status=status.HTTP_409_CONFLICT)
+            
+            indices_processor = IndicesProcessor()
+            output_paths = indices_processor.process_indices(file_path, workspace, layer, indices)
+            
+            if not output_paths:
+                error_msg = f"{'/'.join(indices)} processing failed"
+                self._publish_failures(kafka_service, workspace, layer, indices, error_msg)
+                return Response({
+                    'error': error_msg
+                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            
+            results = geoserver_service.publish_many(
+                (workspace, f"{layer}_{index}", output_paths[index]) for index in indices
+            )
+            
+            created = []
+            failed = []
+            for index, (key, success, error) in zip(indices, results):
+                index_layer_name = f"{layer}_{index}"
+                if success:
+                    kafka_service.publish_success(
+                        workspace=workspace,
+                        store_name=index_layer_name,
+                        layer_type=index,
+                        original_layer=layer,
+                        file_path=output_paths[index]
+                    )
+                    created.append({'layer_name': key, 'file_path': output_paths[index]})
+                else:
+                    cleanup_file(output_paths[index])
+                    kafka_service.publish_failure(
+                        workspace=workspace,
+                        store_name=index_layer_name,
+                        layer_type=index,
+                        original_layer=layer,
+                        error_message=f'Failed to publish {index} layer to GeoServer'
+                    )
+                    failed.append(key)
+            
+            if failed:
+                return Response({
+                    'error': f"Failed to publish {', '.join(failed)} to GeoServer",
+                    'layers': created
+                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            
+            return Response({
+                'message': f"Layers {', '.join(item['layer_name'] for item in created)} successfully created",
+                'layers': created
+            }, status=status.HTTP_201_CREATED)
+            
+        except Exception as e:
+            error_msg = 'Internal processing error'
+            logger.error(f"Index processing error: {str(e)}")
+            
+            if workspace and layer and indices:
+                self._publish_failures(
+                    kafka_service, workspace, layer, indices, f"Internal error: {str(e)}"
+                )
+            
+            return Response({
+                'error': error_msg
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    def _validate_layer_format(self, layer_name):
+        return bool(layer_name) and _LAYER_RE.match(layer_name) is not None
+    
+    def _parse_indices(self, indices):
+        """Normalise the requested indices, returns an empty list if any is unsupported"""
+        if not isinstance(indices, list) or not indices:
+            return []
+        
+        parsed = []
+        for index in indices:
+            if not isinstance(index, str) or index.upper() not in SUPPORTED_INDICES:
+                return []
+            if index.upper() not in parsed:
+                parsed.append(index.upper())
+        return parsed
+    
+    def _publish_failures(self, kafka_service, workspace, layer, indices, error_message):
+        for index in indices:
+            kafka_service.publish_failure(
+                workspace=workspace,
+                store_name=f"{layer}_{index}",
+                layer_type=index,
+                original_layer=layer,
+                error_message=error_message
+            )
@@ -91,6 +91,25 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Resolved GeoServer layer file paths, keyed by workspace:layer_name
+    'geoserver': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'geoserver-layer-paths',
+        'TIMEOUT': 3600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 256,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -141,6 +160,9 @@ GEOSERVER_PASSWORD = os.getenv('GEOSERVER_PASSWORD', 'geoserver')
 KAFKA_BOOTSTRAP_SERVERS = os.getenv('KAFKA_BOOTSTRAP_SERVERS', '10.208.26.232:9092')
 KAFKA_TOPIC = os.getenv('KAFKA_TOPIC', 'image-processing-status')
 
+# Compute NDVI/NDWI on an NVIDIA GPU with CuPy (requires cupy to be installed)
+NDVI_USE_CUPY = os.getenv('NDVI_USE_CUPY', 'False').lower() == 'true'
+
 
 LOGS_DIR = os.path.join(BASE_DIR, 'logs')
 if not os.path.exists(LOGS_DIR):